@@ -10,3 +10,4 @@ visit_collection = database.get_collection("visits")
 bill_collection = database.get_collection("bills")
 treatment_collection = database.get_collection("treatments")
 counter_collection = database.get_collection("counters")
+idempotency_collection = database.get_collection("idempotency_keys")
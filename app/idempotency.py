@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.db import idempotency_collection
+
+# Stored responses are dropped by MongoDB's TTL monitor after this long.
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+# A "pending" key not renewed for this long belongs to a request that died or
+# could not store its response. It is never re-run, since its write may already
+# have gone through; duplicates get a 409 until the key expires.
+LOCK_TIMEOUT = timedelta(seconds=30)
+# How often the request holding a key renews its lock while the handler runs.
+LOCK_RENEW_INTERVAL = LOCK_TIMEOUT.total_seconds() / 3
+# How long a duplicate request waits for the original one to finish.
+WAIT_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+# Attempts at storing the response before giving up.
+COMPLETE_ATTEMPTS = 3
+
+
+async def ensure_idempotency_indexes():
+    """
+    Creates the TTL index that expires old idempotency records.
+    """
+    await idempotency_collection.create_index("createdAt", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)
+
+
+def _fingerprint(scope: str, payload: Any) -> str:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, default=str)
+    return hashlib.sha256(f"{scope}\n{body}".encode("utf-8")).hexdigest()
+
+
+async def _claim(key: str, fingerprint: str, owner: str) -> bool:
+    """
+    Tries to become the request that actually executes for this key.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        await idempotency_collection.insert_one({
+            "_id": key, "fingerprint": fingerprint, "status": "pending", "owner": owner,
+            "response": None, "createdAt": now, "lockedAt": now
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _is_stale(record: dict) -> bool:
+    locked_at = record["lockedAt"]
+    if locked_at.tzinfo is None:
+        # Motor returns naive UTC datetimes by default
+        locked_at = locked_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - locked_at > LOCK_TIMEOUT
+
+
+async def _renew_lock(key: str, owner: str):
+    """
+    Keeps the claim fresh so duplicates keep waiting for a slow handler.
+    """
+    while True:
+        await asyncio.sleep(LOCK_RENEW_INTERVAL)
+        try:
+            await idempotency_collection.update_one(
+                {"_id": key, "owner": owner, "status": "pending"},
+                {"$set": {"lockedAt": datetime.now(timezone.utc)}}
+            )
+        except PyMongoError:
+            # Try again on the next tick; the lock only goes stale after LOCK_TIMEOUT
+            pass
+
+
+async def _complete(key: str, owner: str, response: Any):
+    for attempt in range(COMPLETE_ATTEMPTS):
+        try:
+            await idempotency_collection.update_one(
+                {"_id": key, "owner": owner},
+                {"$set": {"status": "completed", "response": response}}
+            )
+            return
+        except PyMongoError:
+            if attempt == COMPLETE_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+async def run_idempotent(
+    key: Optional[str], scope: str, payload: Any, handler: Callable[[], Awaitable[Any]]
+) -> Any:
+    """
+    Runs `handler` at most once per idempotency key.
+
+    The first request with a given key executes the handler and stores its
+    response; retries with the same key and payload get the stored response
+    back without touching counters or collections again.
+
+    Args:
+        key (str): Value of the Idempotency-Key header, or None to skip de-duplication.
+        scope (str): Method and path of the endpoint (e.g., 'POST /patients').
+        payload: The request body, used to detect a key reused for a different request.
+        handler: Coroutine function that performs the write and returns the response.
+
+    Returns:
+        The handler's response, either freshly computed or replayed.
+    """
+    if not key:
+        return await handler()
+
+    fingerprint = _fingerprint(scope, payload)
+    owner = uuid.uuid4().hex
+    deadline = asyncio.get_running_loop().time() + WAIT_TIMEOUT
+
+    while not await _claim(key, fingerprint, owner):
+        record = await idempotency_collection.find_one({"_id": key})
+        if record is None:
+            # The original request failed and released the key; try again
+            continue
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different request"
+            )
+        if record["status"] == "completed":
+            return record["response"]
+        if _is_stale(record):
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key did not finish and may already have been applied"
+            )
+        if asyncio.get_running_loop().time() > deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed"
+            )
+        await asyncio.sleep(POLL_INTERVAL)
+
+    renewer = asyncio.create_task(_renew_lock(key, owner))
+    try:
+        try:
+            response = await handler()
+        except BaseException:
+            # Let the client retry with the same key
+            await idempotency_collection.delete_one({"_id": key, "owner": owner, "status": "pending"})
+            raise
+        await _complete(key, owner, response)
+    finally:
+        renewer.cancel()
+    return response
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware  # 1. Import the CORSMiddleware
 from app.routes import services
@@ -6,12 +7,19 @@ from app.routes import visits
 from app.routes import billing
 from app.routes import reports
 from app.routes import dashboard
+from app.idempotency import ensure_idempotency_indexes
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_idempotency_indexes()
+    yield
 
 # Create the FastAPI app instance
 app = FastAPI(
     title="Sri Ram Physico Clinic API",
     description="API for managing patients, visits, and billing for the Sri Ram Physico Clinic.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 2. Define the origins that are allowed to connect.
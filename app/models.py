@@ -32,12 +32,14 @@ class PatientCreate(PatientBase): pass
 class VisitBase(BaseModel): problem: str
 class VisitCreate(VisitBase): patient_id: str
 
-class TreatmentInBill(BaseModel): treatment_id: PyObjectId; name: str; cost: float
-class BillUpdate(BaseModel): treatments: List[TreatmentInBill]; totalAmount: float; paymentStatus: str; paymentMethod: Optional[str] = None; medicalRemark: Optional[str] = None; paymentDate: Optional[datetime] = None
+class TreatmentInBill(BaseModel): treatment_id: PyObjectId; name: str; cost: Optional[float] = None; catalogVersion: Optional[int] = None
+# Line costs and totalAmount sent by the client are ignored; they are priced on the server when the bill is saved
+class BillUpdate(BaseModel): treatments: List[TreatmentInBill]; totalAmount: Optional[float] = None; paymentStatus: str; paymentMethod: Optional[str] = None; medicalRemark: Optional[str] = None; paymentDate: Optional[datetime] = None
 
 # --- Response Models ---
 class TreatmentResponse(TreatmentBase):
     id: PyObjectId = Field(alias="_id", default=None)
+    version: int = 0  # Services created before versioning have none
     model_config = {"arbitrary_types_allowed": True, "populate_by_name": True, "json_encoders": {ObjectId: str}}
 
 class PatientResponse(PatientBase):
@@ -65,6 +67,11 @@ class NewPatientReportRow(BaseModel): patient_id: str; fullName: str; contactNum
 class FullReportResponse(BaseModel):
     summary: ReportSummary; payments: List[PaymentReportRow]; services: List[ServiceReportRow]; newPatients: List[NewPatientReportRow]
 
+class BillDriftRow(BaseModel): bill_id: str; storedTotal: float; computedTotal: float
+class ReconciliationReport(BaseModel):
+    billsInCollection: int; driftedBills: int; totalDrift: float; fixedBills: int
+    drift: List[BillDriftRow]  # First few drifted bills only
+
 # --- NEW: Dashboard Model ---
 class DashboardStats(BaseModel):
     totalVisits: int
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from typing import List, Tuple
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from app.db import bill_collection, treatment_collection
+from app.models import TreatmentInBill
+
+# How long a worker trusts its cached copy of the treatment catalog
+CATALOG_CACHE_SECONDS = 60
+# Totals that differ by less than half a paisa are not considered drift
+MONEY_TOLERANCE = 0.005
+
+# Recomputes a bill's total from its stored line costs, inside MongoDB
+COMPUTED_TOTAL = {"$round": [{"$sum": "$treatments.cost"}, 2]}
+
+
+class TreatmentCatalog:
+    """
+    In-memory cache of the treatments collection, keyed by ObjectId.
+    """
+    def __init__(self):
+        self._treatments = None
+        self._loaded_at = 0.0
+        # Bumped by invalidate() so a load that overlapped a service edit is thrown away
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._treatments = None
+        self._generation += 1
+
+    def _is_fresh(self) -> bool:
+        return self._treatments is not None and time.monotonic() - self._loaded_at < CATALOG_CACHE_SECONDS
+
+    async def get(self) -> dict:
+        while not self._is_fresh():
+            async with self._lock:
+                if self._is_fresh():
+                    break
+                generation = self._generation
+                treatments = await treatment_collection.find({}, {"name": 1, "cost": 1, "version": 1}).to_list(None)
+                if generation == self._generation:
+                    self._treatments = {t["_id"]: t for t in treatments}
+                    self._loaded_at = time.monotonic()
+        return self._treatments
+
+
+catalog = TreatmentCatalog()
+
+
+async def price_treatments(treatments: List[TreatmentInBill], saved_lines: List[dict]) -> Tuple[List[dict], float]:
+    """
+    Prices bill lines, ignoring client-supplied costs.
+
+    Lines already saved on the bill keep the cost and catalog version they were
+    priced at; only newly added lines are priced from the current catalog.
+
+    Args:
+        treatments (List[TreatmentInBill]): The lines sent by the client.
+        saved_lines (List[dict]): The lines currently stored on the bill.
+
+    Returns:
+        The priced lines and the bill total.
+    """
+    # Stored ids are strings (TreatmentInBill dumps PyObjectId as str); match on str either way
+    saved = {}
+    for line in saved_lines:
+        saved.setdefault(str(line["treatment_id"]), []).append(line)
+
+    lines, new_treatments = [], []
+    for t in treatments:
+        if saved.get(str(t.treatment_id)):
+            kept = saved[str(t.treatment_id)].pop(0)
+            lines.append({
+                "treatment_id": str(kept["treatment_id"]), "name": kept["name"],
+                "cost": float(kept["cost"]), "catalogVersion": kept.get("catalogVersion")
+            })
+        else:
+            lines.append(None)
+            new_treatments.append((len(lines) - 1, t))
+
+    if new_treatments:
+        known = await catalog.get()
+        if any(t.treatment_id not in known for _, t in new_treatments):
+            # The treatment may have been added since the cache was loaded
+            catalog.invalidate()
+            known = await catalog.get()
+
+        for index, t in new_treatments:
+            entry = known.get(t.treatment_id)
+            if entry is None:
+                raise HTTPException(status_code=400, detail=f"Treatment with ID {t.treatment_id} not found")
+            lines[index] = {
+                "treatment_id": str(entry["_id"]), "name": entry["name"],
+                "cost": float(entry["cost"]), "catalogVersion": entry.get("version", 0)
+            }
+
+    return lines, round(sum(line["cost"] for line in lines), 2)
+
+
+async def reconcile_bill_totals(fix: bool = False, batch_size: int = 1000, sample_limit: int = 100) -> dict:
+    """
+    Finds bills whose totalAmount does not match the sum of their line costs.
+
+    The totals are recomputed by MongoDB over each bill's treatments array, so
+    only drifted bills are streamed back, one cursor batch at a time. Fixes are
+    sent as bulk writes of at most `batch_size` updates.
+
+    Args:
+        fix (bool): Overwrite drifted totals with the recomputed value.
+        batch_size (int): Cursor batch size and bulk write size.
+        sample_limit (int): Maximum number of drifted bills listed in the report.
+
+    Returns:
+        dict: Matches the ReconciliationReport model.
+    """
+    pipeline = [
+        {"$project": {
+            "bill_id": 1,
+            "storedTotal": {"$ifNull": ["$totalAmount", 0]},
+            "computedTotal": COMPUTED_TOTAL
+        }},
+        {"$match": {"$expr": {"$gt": [{"$abs": {"$subtract": ["$storedTotal", "$computedTotal"]}}, MONEY_TOLERANCE]}}}
+    ]
+
+    bills_in_collection = await bill_collection.count_documents({})
+    drifted, total_drift, fixed = 0, 0.0, 0
+    samples, pending_fixes = [], []
+
+    async for bill in bill_collection.aggregate(pipeline, batchSize=batch_size):
+        drifted += 1
+        total_drift += bill["computedTotal"] - bill["storedTotal"]
+        if len(samples) < sample_limit:
+            samples.append({
+                "bill_id": bill.get("bill_id", str(bill["_id"])),
+                "storedTotal": bill["storedTotal"], "computedTotal": bill["computedTotal"]
+            })
+        if fix:
+            # Recompute inside the update so a bill saved meanwhile is not overwritten with stale lines
+            pending_fixes.append(UpdateOne({"_id": bill["_id"]}, [{"$set": {"totalAmount": COMPUTED_TOTAL}}]))
+            if len(pending_fixes) >= batch_size:
+                result = await bill_collection.bulk_write(pending_fixes, ordered=False)
+                fixed += result.modified_count
+                pending_fixes = []
+
+    if pending_fixes:
+        result = await bill_collection.bulk_write(pending_fixes, ordered=False)
+        fixed += result.modified_count
+
+    return {
+        "billsInCollection": bills_in_collection, "driftedBills": drifted,
+        "totalDrift": round(total_drift, 2), "fixedBills": fixed, "drift": samples
+    }
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Header, Query
+from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime, time
 from zoneinfo import ZoneInfo
 
 from app.db import bill_collection, patient_collection, visit_collection
-from app.models import BillUpdate, BillResponse
+from app.models import BillUpdate, BillResponse, ReconciliationReport
+from app.idempotency import run_idempotent
+from app.pricing import price_treatments, reconcile_bill_totals
 
 router = APIRouter()
 
@@ -67,6 +69,14 @@ async def get_bills_by_patient(patient_id: str):
     bills = await bill_collection.aggregate(pipeline).to_list(1000)
     return bills
 
+@router.post("/reconcile", response_model=ReconciliationReport)
+async def reconcile_bills(fix: bool = Query(False), batch_size: int = Query(1000, ge=1, le=10000)):
+    """
+    Report bills whose totalAmount differs from the sum of their treatments,
+    and optionally correct them.
+    """
+    return await reconcile_bill_totals(fix=fix, batch_size=batch_size)
+
 @router.get("/{bill_id}", response_model=BillResponse)
 async def get_bill(bill_id: str):
     if not ObjectId.is_valid(bill_id):
@@ -78,13 +88,25 @@ async def get_bill(bill_id: str):
     return bills[0]
 
 @router.put("/{bill_id}", response_model=BillResponse)
-async def update_bill(bill_id: str, bill: BillUpdate):
+async def update_bill(bill_id: str, bill: BillUpdate, idempotency_key: Optional[str] = Header(None)):
+    """
+    Save a bill. Line costs and the total are priced from the treatment catalog.
+    Retries carrying the same Idempotency-Key header return the originally
+    saved bill without writing it again.
+    """
     if not ObjectId.is_valid(bill_id):
         raise HTTPException(status_code=400, detail="Invalid bill ID format")
+    return await run_idempotent(idempotency_key, f"PUT /billing/{bill_id}", bill, lambda: _save_bill(bill_id, bill))
+
+async def _save_bill(bill_id: str, bill: BillUpdate):
+    saved_bill = await bill_collection.find_one({"_id": ObjectId(bill_id)}, {"treatments": 1})
+    if saved_bill is None:
+        raise HTTPException(status_code=404, detail=f"Bill with ID {bill_id} not found")
 
     update_data = bill.model_dump(by_alias=True, exclude_unset=True)
-    if bill.treatments is not None:
-        update_data["treatments"] = [t.model_dump() for t in bill.treatments]
+    update_data["treatments"], update_data["totalAmount"] = await price_treatments(
+        bill.treatments, saved_bill.get("treatments", [])
+    )
 
     if bill.paymentStatus == "Paid":
         update_data["paymentDate"] = datetime.now(IST)
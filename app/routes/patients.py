@@ -1,18 +1,23 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Header
+from typing import List, Optional
 from bson import ObjectId
 
 from app.db import patient_collection
 from app.models import PatientCreate, PatientResponse
 from app.utils import get_next_sequence
+from app.idempotency import run_idempotent
 
 router = APIRouter()
 
 @router.post("/", response_model=PatientResponse, status_code=status.HTTP_201_CREATED)
-async def create_patient(patient: PatientCreate):
+async def create_patient(patient: PatientCreate, idempotency_key: Optional[str] = Header(None)):
     """
-    Create a new patient.
+    Create a new patient. Retries carrying the same Idempotency-Key header
+    return the originally created patient instead of inserting a duplicate.
     """
+    return await run_idempotent(idempotency_key, "POST /patients", patient, lambda: _insert_patient(patient))
+
+async def _insert_patient(patient: PatientCreate):
     # Generate the next readable patient ID
     next_id_num = await get_next_sequence("patients")
     readable_id = f"PT-{next_id_num:03d}"
@@ -4,6 +4,7 @@ from bson import ObjectId
 
 from app.db import treatment_collection
 from app.models import TreatmentCreate, TreatmentResponse
+from app.pricing import catalog
 
 router = APIRouter()
 
@@ -13,7 +14,9 @@ async def create_service(treatment: TreatmentCreate):
     Create a new treatment/service.
     """
     treatment_dict = treatment.model_dump()
+    treatment_dict["version"] = 1
     result = await treatment_collection.insert_one(treatment_dict)
+    catalog.invalidate()
     created_treatment = await treatment_collection.find_one({"_id": result.inserted_id})
     return created_treatment
 
@@ -41,15 +44,17 @@ async def get_service(service_id: str):
 @router.put("/{service_id}", response_model=TreatmentResponse)
 async def update_service(service_id: str, treatment: TreatmentCreate):
     """
-    Update an existing service.
+    Update an existing service. Its version is bumped so bills record which
+    price they were charged at.
     """
     if not ObjectId.is_valid(service_id):
         raise HTTPException(status_code=400, detail="Invalid service ID format")
 
     update_result = await treatment_collection.update_one(
         {"_id": ObjectId(service_id)},
-        {"$set": treatment.model_dump()}
+        {"$set": treatment.model_dump(), "$inc": {"version": 1}}
     )
+    catalog.invalidate()
 
     if update_result.matched_count == 0:
         raise HTTPException(status_code=404, detail=f"Service with ID {service_id} not found")
@@ -66,6 +71,7 @@ async def delete_service(service_id: str):
         raise HTTPException(status_code=400, detail="Invalid service ID format")
 
     delete_result = await treatment_collection.delete_one({"_id": ObjectId(service_id)})
+    catalog.invalidate()
 
     if delete_result.deleted_count == 0:
         raise HTTPException(status_code=404, detail=f"Service with ID {service_id} not found")
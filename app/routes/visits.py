@@ -1,5 +1,5 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Header
+from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime, time
 from zoneinfo import ZoneInfo
@@ -7,6 +7,7 @@ from zoneinfo import ZoneInfo
 from app.db import visit_collection, patient_collection, bill_collection
 from app.models import VisitCreate, VisitResponse
 from app.utils import get_next_sequence
+from app.idempotency import run_idempotent
 
 router = APIRouter()
 
@@ -14,10 +15,14 @@ router = APIRouter()
 IST = ZoneInfo("Asia/Kolkata")
 
 @router.post("/", response_model=VisitResponse, status_code=status.HTTP_201_CREATED)
-async def create_visit(visit: VisitCreate):
+async def create_visit(visit: VisitCreate, idempotency_key: Optional[str] = Header(None)):
     """
     Create a new visit for a patient and an associated unpaid bill.
+    Retries carrying the same Idempotency-Key header return the original visit.
     """
+    return await run_idempotent(idempotency_key, "POST /visits", visit, lambda: _insert_visit(visit))
+
+async def _insert_visit(visit: VisitCreate):
     if not ObjectId.is_valid(visit.patient_id):
         raise HTTPException(status_code=400, detail="Invalid patient ID format")
     
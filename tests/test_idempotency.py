@@ -0,0 +1,196 @@
+import asyncio
+import copy
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app import idempotency
+from app.idempotency import run_idempotent
+
+
+class FakeCollection:
+    """
+    Minimal in-memory stand-in for the idempotency_keys collection.
+    Every call yields to the event loop, like a real round trip would.
+    """
+    def __init__(self):
+        self.docs = {}
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, expected in query.items():
+            if isinstance(expected, dict) and "$lt" in expected:
+                if not doc.get(field) < expected["$lt"]:
+                    return False
+            elif doc.get(field) != expected:
+                return False
+        return True
+
+    def _find(self, query):
+        doc = self.docs.get(query["_id"])
+        return doc if doc is not None and self._matches(doc, query) else None
+
+    async def insert_one(self, doc):
+        await asyncio.sleep(0)
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate key")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    async def find_one(self, query):
+        await asyncio.sleep(0)
+        return copy.deepcopy(self._find(query))
+
+    async def update_one(self, query, update):
+        await asyncio.sleep(0)
+        doc = self._find(query)
+        if doc is not None:
+            doc.update(update["$set"])
+
+    async def delete_one(self, query):
+        await asyncio.sleep(0)
+        if self._find(query) is not None:
+            del self.docs[query["_id"]]
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    fake = FakeCollection()
+    monkeypatch.setattr(idempotency, "idempotency_collection", fake)
+    monkeypatch.setattr(idempotency, "POLL_INTERVAL", 0.001)
+    return fake
+
+
+def make_handler(calls):
+    async def handler():
+        # Stands in for get_next_sequence + insert_one
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"patient_id": f"PT-{len(calls):03d}"}
+    return handler
+
+
+def test_parallel_duplicates_run_handler_once(collection):
+    calls = []
+    handler = make_handler(calls)
+
+    async def fire():
+        return await asyncio.gather(*[
+            run_idempotent("key-1", "POST /patients", {"fullName": "Ravi"}, handler) for _ in range(10)
+        ])
+
+    responses = asyncio.run(fire())
+
+    assert len(calls) == 1
+    assert responses == [{"patient_id": "PT-001"}] * 10
+    assert collection.docs["key-1"]["status"] == "completed"
+
+
+def test_same_key_different_body_is_rejected(collection):
+    calls = []
+    handler = make_handler(calls)
+
+    async def fire():
+        await run_idempotent("key-1", "POST /patients", {"fullName": "Ravi"}, handler)
+        await run_idempotent("key-1", "POST /patients", {"fullName": "Sita"}, handler)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(fire())
+
+    assert exc_info.value.status_code == 422
+    assert len(calls) == 1
+
+
+def test_failed_handler_releases_key(collection):
+    calls = []
+
+    async def failing_handler():
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    async def fire():
+        with pytest.raises(HTTPException):
+            await run_idempotent("key-1", "POST /visits", {"problem": "Back pain"}, failing_handler)
+        assert "key-1" not in collection.docs
+        return await run_idempotent("key-1", "POST /visits", {"problem": "Back pain"}, make_handler(calls))
+
+    assert asyncio.run(fire()) == {"patient_id": "PT-001"}
+    assert len(calls) == 1
+
+
+def test_no_key_skips_deduplication(collection):
+    calls = []
+    handler = make_handler(calls)
+
+    async def fire():
+        await run_idempotent(None, "POST /patients", {"fullName": "Ravi"}, handler)
+        await run_idempotent(None, "POST /patients", {"fullName": "Ravi"}, handler)
+
+    asyncio.run(fire())
+
+    assert len(calls) == 2
+    assert collection.docs == {}
+
+
+def test_request_that_lost_its_claim_leaves_it_alone(collection):
+    async def taken_over_handler(fail):
+        # Another request takes the key over while this handler is still running
+        collection.docs["key-1"].update({"owner": "other", "response": {"patient_id": "PT-002"}})
+        if fail:
+            raise HTTPException(status_code=500, detail="Insert failed")
+        return {"patient_id": "PT-001"}
+
+    async def fire(fail):
+        collection.docs.clear()
+        try:
+            await run_idempotent("key-1", "POST /patients", {"fullName": "Ravi"}, lambda: taken_over_handler(fail))
+        except HTTPException:
+            pass
+
+    for fail in (False, True):
+        asyncio.run(fire(fail))
+        assert collection.docs["key-1"]["owner"] == "other"
+        assert collection.docs["key-1"]["status"] == "pending"
+        assert collection.docs["key-1"]["response"] == {"patient_id": "PT-002"}
+
+
+def test_lock_is_renewed_while_handler_runs(collection, monkeypatch):
+    monkeypatch.setattr(idempotency, "LOCK_RENEW_INTERVAL", 0.005)
+    renewed = []
+
+    async def slow_handler():
+        locked_at = collection.docs["key-1"]["lockedAt"]
+        await asyncio.sleep(0.05)
+        renewed.append(collection.docs["key-1"]["lockedAt"] > locked_at)
+        return {"patient_id": "PT-001"}
+
+    asyncio.run(run_idempotent("key-1", "POST /patients", {"fullName": "Ravi"}, slow_handler))
+
+    assert renewed == [True]
+
+
+def test_applied_request_is_not_rerun_when_storing_response_fails(collection, monkeypatch):
+    calls = []
+    handler = make_handler(calls)
+    update_one = collection.update_one
+
+    async def failing_complete(query, update):
+        if update["$set"].get("status") == "completed":
+            raise PyMongoError("connection lost")
+        await update_one(query, update)
+
+    monkeypatch.setattr(collection, "update_one", failing_complete)
+
+    async def fire():
+        return await run_idempotent("key-1", "POST /patients", {"fullName": "Ravi"}, handler)
+
+    with pytest.raises(PyMongoError):
+        asyncio.run(fire())
+
+    # Even once the lock has gone stale, a retry must not insert the patient again
+    collection.docs["key-1"]["lockedAt"] -= idempotency.LOCK_TIMEOUT + timedelta(seconds=1)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(fire())
+
+    assert exc_info.value.status_code == 409
+    assert len(calls) == 1
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app import pricing
+from app.models import TreatmentInBill
+from app.pricing import TreatmentCatalog, price_treatments
+
+MASSAGE = ObjectId()
+TRACTION = ObjectId()
+
+
+class FakeCursor:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def to_list(self, length):
+        self.collection.loads += 1
+        snapshot = [dict(t) for t in self.collection.treatments]
+        if self.collection.on_load:
+            await self.collection.on_load()
+        return snapshot
+
+
+class FakeTreatmentCollection:
+    def __init__(self, treatments):
+        self.treatments = treatments
+        self.loads = 0
+        self.on_load = None
+
+    def find(self, query, projection):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def treatments(monkeypatch):
+    fake = FakeTreatmentCollection([
+        {"_id": MASSAGE, "name": "Massage", "cost": 500, "version": 3},
+        {"_id": TRACTION, "name": "Traction", "cost": 300},
+    ])
+    monkeypatch.setattr(pricing, "treatment_collection", fake)
+    monkeypatch.setattr(pricing, "catalog", TreatmentCatalog())
+    return fake
+
+
+def test_new_lines_are_priced_from_catalog(treatments):
+    lines, total = asyncio.run(price_treatments([
+        TreatmentInBill(treatment_id=MASSAGE, name="Massage", cost=1),
+        TreatmentInBill(treatment_id=TRACTION, name="Traction"),
+    ], []))
+
+    assert [(l["cost"], l["catalogVersion"]) for l in lines] == [(500.0, 3), (300.0, 0)]
+    assert total == 800.0
+
+
+def test_saved_lines_keep_their_price(treatments):
+    saved = [{"treatment_id": MASSAGE, "name": "Massage", "cost": 450.0, "catalogVersion": 2}]
+    # The service has since been repriced and then deleted
+    treatments.treatments = [t for t in treatments.treatments if t["_id"] != MASSAGE]
+
+    lines, total = asyncio.run(price_treatments([
+        TreatmentInBill(treatment_id=MASSAGE, name="Massage", cost=450),
+        TreatmentInBill(treatment_id=MASSAGE, name="Massage", cost=450),
+    ], saved + [dict(saved[0])]))
+
+    assert [(l["cost"], l["catalogVersion"]) for l in lines] == [(450.0, 2), (450.0, 2)]
+    assert total == 900.0
+    assert treatments.loads == 0
+
+
+@pytest.mark.parametrize("catalog_change", ["repriced", "deleted"])
+def test_lines_saved_with_str_ids_keep_their_price(treatments, catalog_change):
+    # Bills saved through update_bill store TreatmentInBill.model_dump(), which turns the id into a str
+    saved = [TreatmentInBill(treatment_id=MASSAGE, name="Massage", cost=450).model_dump()]
+    assert isinstance(saved[0]["treatment_id"], str)
+    if catalog_change == "repriced":
+        treatments.treatments[0].update({"cost": 650, "version": 4})
+    else:
+        treatments.treatments = [t for t in treatments.treatments if t["_id"] != MASSAGE]
+
+    lines, total = asyncio.run(price_treatments([
+        TreatmentInBill(treatment_id=MASSAGE, name="Massage", cost=450),
+        TreatmentInBill(treatment_id=TRACTION, name="Traction"),
+    ], saved))
+
+    assert [l["cost"] for l in lines] == [450.0, 300.0]
+    assert all(isinstance(l["treatment_id"], str) for l in lines)
+    assert total == 750.0
+
+
+def test_unknown_new_treatment_is_rejected(treatments):
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(price_treatments([TreatmentInBill(treatment_id=ObjectId(), name="Unknown")], []))
+
+    assert exc_info.value.status_code == 400
+
+
+def test_load_overlapping_an_edit_is_discarded(treatments):
+    catalog = pricing.catalog
+
+    async def edit_during_first_load():
+        if treatments.loads == 1:
+            treatments.treatments = [{"_id": MASSAGE, "name": "Massage", "cost": 600, "version": 4}]
+            catalog.invalidate()
+
+    treatments.on_load = edit_during_first_load
+    known = asyncio.run(catalog.get())
+
+    assert treatments.loads == 2
+    assert known[MASSAGE]["cost"] == 600